@@ -1,6 +1,10 @@
 """ Function to get NWP data and create fake PV dataset"""
+import logging
+import os
 import ssl
-from datetime import datetime
+import tempfile
+import time
+from datetime import datetime, timedelta
 from typing import Optional
 
 import numpy as np
@@ -14,19 +18,53 @@ from quartz_solar_forecast.pydantic_models import PVSite
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
+log = logging.getLogger(__name__)
 
-def get_nwp(site: PVSite, ts: datetime, nwp_source: str = "icon") -> xr.Dataset:
+NWP_CACHE_DIR = os.path.expanduser("~/.cache/quartz_solar_forecast/nwp")
+
+# NWP data for timestamps in the last week can still change, so these cache entries expire.
+# The same expiry is used for the forecast API responses in the requests_cache session of get_nwp,
+# otherwise an expired entry would be refetched from the stale HTTP cache.
+NWP_CACHE_RECENT = timedelta(days=7)
+NWP_CACHE_EXPIRY = timedelta(hours=24)
+
+# Timestamps more than this many days in the past use the historical (reanalysis) weather API
+NWP_ARCHIVE_DAYS = 90
+
+
+def is_archive_ts(ts: datetime) -> bool:
+    """
+    Check whether NWP data for a timestamp comes from the historical weather API
+
+    :param ts: the timestamp for when you want the forecast for
+    :return: True if ts is more than 3 months in the past
+    """
+    return (datetime.now() - ts).days > NWP_ARCHIVE_DAYS
+
+
+def get_nwp(
+    site: PVSite, ts: datetime, nwp_source: str = "icon", forecast_days: int = 7
+) -> xr.Dataset:
     """
     Get GFS NWP data for a point time space and time
 
     :param site: the PV site
     :param ts: the timestamp for when you want the forecast for
     :param nwp_source: the nwp data source. Either "gfs", "icon" or "ukmo". Defaults to "icon"
+    :param forecast_days: the number of days of data to get, from the date of ts. Defaults to 7
     :return: nwp forecast in xarray
     """
 
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
+    # Setup the Open-Meteo API client with cache and retry on error.
+    # Historical data never changes, but forecast data can, so those responses expire.
+    cache_session = requests_cache.CachedSession(
+        '.cache',
+        expire_after = -1,
+        urls_expire_after = {
+            "archive-api.open-meteo.com": -1,
+            "api.open-meteo.com": NWP_CACHE_EXPIRY,
+        },
+    )
     retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
     openmeteo = openmeteo_requests.Client(session = retry_session)
 
@@ -43,12 +81,12 @@ def get_nwp(site: PVSite, ts: datetime, nwp_source: str = "icon") -> xr.Dataset:
     ]
 
     start = ts.date()
-    end = start + pd.Timedelta(days=7)
+    end = start + pd.Timedelta(days=forecast_days)
 
     url = ""
 
     # check whether the time stamp is more than 3 months in the past
-    if (datetime.now() - ts).days > 90:
+    if is_archive_ts(ts):
         print("Warning: The requested timestamp is more than 3 months in the past. The weather data are provided by a reanalyse model and not ICON or GFS.")
 
         # load data from open-meteo Historical Weather API
@@ -102,7 +140,7 @@ def get_nwp(site: PVSite, ts: datetime, nwp_source: str = "icon") -> xr.Dataset:
     hourly_data["dlwrf"] = hourly.Variables(7).ValuesAsNumpy()
 
     # handle visibility
-    if (datetime.now() - ts).days <= 90:
+    if not is_archive_ts(ts):
         # load data from open-meteo gfs model
         params = {
         	"latitude": site.latitude,
@@ -126,6 +164,84 @@ def get_nwp(site: PVSite, ts: datetime, nwp_source: str = "icon") -> xr.Dataset:
 
     return data_xr
 
+def get_nwp_cached(
+    site: PVSite, ts: datetime, nwp_source: str = "icon", forecast_days: int = 7
+) -> xr.Dataset:
+    """
+    Get NWP data, using a copy cached on disk in NWP_CACHE_DIR if there is one
+
+    The data only depends on the date of ts, so entries are keyed by date.
+    Cached data that ends on a historical date is kept forever, but data that runs into the last
+    week is only used for 24 hours, after which it is deleted.
+
+    :param site: the PV site
+    :param ts: the timestamp for when you want the forecast for
+    :param nwp_source: the nwp data source. Either "gfs", "icon" or "ukmo". Defaults to "icon"
+    :param forecast_days: the number of days of data to get, from the date of ts. Defaults to 7
+    :return: nwp forecast in xarray
+    """
+    api = "archive" if is_archive_ts(ts) else "forecast"
+    filename = (
+        f"{nwp_source}_{site.latitude}_{site.longitude}_"
+        f"{ts.strftime('%Y%m%d')}_{api}_{forecast_days}d.nc"
+    )
+    path = os.path.join(NWP_CACHE_DIR, filename)
+
+    if os.path.exists(path):
+        age = timedelta(seconds=time.time() - os.path.getmtime(path))
+        # the data runs until forecast_days after ts, so that end decides whether it can still change
+        end = ts.date() + timedelta(days=forecast_days)
+        is_recent = end > (datetime.now() - NWP_CACHE_RECENT).date()
+        if is_recent and age >= NWP_CACHE_EXPIRY:
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning(f"Could not remove expired NWP data {path}: {e}")
+        else:
+            try:
+                return xr.load_dataset(path, engine="netcdf4")
+            except (OSError, ValueError) as e:
+                log.warning(f"Could not read cached NWP data from {path}: {e}")
+
+    data_xr = get_nwp(site=site, ts=ts, nwp_source=nwp_source, forecast_days=forecast_days)
+
+    # write to a temporary file first, so other processes never read a partially written file
+    tmp_path = None
+    try:
+        os.makedirs(NWP_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=NWP_CACHE_DIR, suffix=".nc.tmp")
+        os.close(fd)
+        data_xr.to_netcdf(tmp_path, engine="netcdf4")
+        os.replace(tmp_path, path)
+    except (OSError, ValueError) as e:
+        log.warning(f"Could not cache NWP data to {path}: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return data_xr
+
+
+def select_nwp_data(nwp_xr: xr.Dataset, ts: datetime, forecast_days: int = 7) -> xr.Dataset:
+    """
+    Select the NWP data that get_nwp would return for ts, from NWP data covering a longer period
+
+    :param nwp_xr: nwp forecast in xarray, from get_nwp for an earlier or the same date as ts
+    :param ts: the timestamp for when you want the forecast for
+    :param forecast_days: the number of days of data to select, from the date of ts. Defaults to 7
+    :return: nwp forecast in xarray
+    """
+    start = pd.Timestamp(ts.date())
+    offset = start - pd.Timestamp(nwp_xr.time.values[0])
+
+    # get_nwp includes the whole end date, so there are forecast_days + 1 days of data
+    steps = nwp_xr.step.values
+    in_window = (steps >= offset) & (steps < offset + pd.Timedelta(days=forecast_days + 1))
+
+    data_xr = nwp_xr.isel(step=in_window)
+    data_xr = data_xr.assign_coords(step=data_xr.step.values - offset.to_timedelta64(), time=[start])
+    return data_xr
+
+
 def format_nwp_data(df: pd.DataFrame, nwp_source:str, site: PVSite):
     data_xr = xr.DataArray(
         data=df.values,
@@ -191,3 +307,16 @@ def make_pv_data(site: PVSite, ts: pd.Timestamp) -> xr.Dataset:
     da = process_pv_data(live_generation_kw, ts, site)
 
     return da
+
+
+def make_pv_data_batch(site: PVSite, timestamps: list[pd.Timestamp]) -> list[xr.Dataset]:
+    """
+    Make PV data for forecasts at several timestamps, only getting the live inverter data once.
+
+    :param site: the PV site
+    :param timestamps: the timestamps of the forecasts
+    :return: The PV dataset in xarray form for each timestamp, as make_pv_data would make it
+    """
+    live_generation_kw = site.get_inverter().get_data(max(timestamps))
+
+    return [process_pv_data(live_generation_kw, ts, site) for ts in timestamps]
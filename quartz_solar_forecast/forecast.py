@@ -1,14 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 import logging
+import threading
 
 import pandas as pd
 
-from quartz_solar_forecast.data import get_nwp, make_pv_data
-from quartz_solar_forecast.forecasts import forecast_v1_tilt_orientation, TryolabsSolarPowerPredictor
 from quartz_solar_forecast.pydantic_models import PVSite
 
 log = logging.getLogger(__name__)
 
+_TRYOLABS_PREDICTOR_LOCK = threading.Lock()
+
+
+def _limit_capacity(site: PVSite) -> tuple[PVSite, float]:
+    """
+    Limit the site capacity to the 4 kWp the gb model is trained on
+
+    :param site: the PV site
+    :return: the site to run the model with, and the original capacity to scale the results to
+    """
+    capacity_kwp_original = site.capacity_kwp
+    if site.capacity_kwp > 4:
+        log.warning("Your site capacity is greater than 4kWp, "
+                    "however the model is trained on sites with capacity <= 4kWp."
+                    "We therefore will run the model with a capacity of 4 kWp, "
+                    "and we'll scale the results afterwards.")
+        # copy the site rather than changing it, as it may be shared with concurrent forecasts
+        site = site.model_copy(update={"capacity_kwp": 4})
+
+    return site, capacity_kwp_original
+
+
 def predict_ocf(
     site: PVSite, model=None, ts: datetime | str = None, nwp_source: str = "icon"
 ):
@@ -21,24 +45,20 @@ def predict_ocf(
     :param nwp_source: the nwp data source. Either "gfs", "icon" or "ukmo". Defaults to "icon" 
     :return: The PV forecast of the site for time (ts) for 48 hours
     """
+    # imported here, so the nwp and model dependencies are only loaded when they are used
+    from quartz_solar_forecast.data import get_nwp_cached, make_pv_data
+    from quartz_solar_forecast.forecasts import forecast_v1_tilt_orientation
+
     if ts is None:
         ts = pd.Timestamp.now().round("15min")
 
     if isinstance(ts, str):
         ts = datetime.fromisoformat(ts)
 
-    if site.capacity_kwp > 4:
-        log.warning("Your site capacity is greater than 4kWp, "
-                    "however the model is trained on sites with capacity <= 4kWp."
-                    "We therefore will run the model with a capacity of 4 kWp, "
-                    "and we'll scale the results afterwards.")
-        capacity_kwp_original = site.capacity_kwp
-        site.capacity_kwp = 4
-    else:
-        capacity_kwp_original = site.capacity_kwp
+    site, capacity_kwp_original = _limit_capacity(site)
 
     # make pv and nwp data from nwp_source
-    nwp_xr = get_nwp(site=site, ts=ts, nwp_source=nwp_source)
+    nwp_xr = get_nwp_cached(site=site, ts=ts, nwp_source=nwp_source)
     pv_xr = make_pv_data(site=site, ts=ts)
 
     # load and run models
@@ -51,6 +71,95 @@ def predict_ocf(
     return pred_df
 
 
+def predict_ocf_batch(
+    site: PVSite, timestamps: list[datetime | str], nwp_source: str = "icon", model=None
+) -> pd.DataFrame:
+    """
+    Run the forecast with the gb model for several timestamps
+
+    The NWP data is fetched once for the timestamps on each side of the 3 month line, where
+    get_nwp switches to historical data, and the PV data and model are loaded once. Each timestamp
+    is then forecast with the same data predict_ocf would use for it.
+
+    :param site: the PV site
+    :param timestamps: the timestamps of the site
+    :param nwp_source: the nwp data source. Either "gfs", "icon" or "ukmo". Defaults to "icon"
+    :param model: the model to use for prediction
+    :return: The PV forecasts of the site for 48 hours from each timestamp,
+             indexed by (timestamp, time)
+    """
+    # imported here, so the nwp and model dependencies are only loaded when they are used
+    from quartz_solar_forecast.data import (
+        get_nwp_cached,
+        is_archive_ts,
+        make_pv_data_batch,
+        select_nwp_data,
+    )
+    from quartz_solar_forecast.forecasts import forecast_v1_tilt_orientation_batch
+
+    if len(timestamps) == 0:
+        raise ValueError("At least one timestamp is needed to run a batch forecast")
+
+    timestamps = [
+        datetime.fromisoformat(ts) if isinstance(ts, str) else ts for ts in timestamps
+    ]
+
+    site, capacity_kwp_original = _limit_capacity(site)
+
+    # get_nwp uses a different api for timestamps more than 3 months ago, so split on that
+    groups = {}
+    for ts in timestamps:
+        groups.setdefault(is_archive_ts(ts), []).append(ts)
+
+    # get nwp data once per group, from the first timestamp until 7 days after the last one,
+    # and select the data for each timestamp from it
+    nwp_xrs = {}
+    for group in groups.values():
+        first_ts, last_ts = min(group), max(group)
+        forecast_days = (last_ts.date() - first_ts.date()).days + 7
+        nwp_xr = get_nwp_cached(
+            site=site, ts=first_ts, nwp_source=nwp_source, forecast_days=forecast_days
+        )
+        for ts in group:
+            nwp_xrs[ts] = select_nwp_data(nwp_xr, ts)
+
+    pv_xrs = make_pv_data_batch(site=site, timestamps=timestamps)
+
+    # load and run models
+    pred_dfs = forecast_v1_tilt_orientation_batch(
+        nwp_source, [nwp_xrs[ts] for ts in timestamps], pv_xrs, timestamps, model=model
+    )
+    pred_df = pd.concat(pred_dfs, keys=timestamps)
+
+    # scale the results if the capacity is different
+    if capacity_kwp_original != site.capacity_kwp:
+        pred_df["power_kw"] = pred_df["power_kw"] * capacity_kwp_original / site.capacity_kwp
+
+    return pred_df
+
+
+@lru_cache(maxsize=1)
+def _load_tryolabs_predictor():
+    """
+    Instantiate the xgb predictor and load its model, downloading and decompressing it if necessary
+    """
+    # imported here, as the tryolabs model depends on xgboost and huggingface_hub
+    from quartz_solar_forecast.forecasts import TryolabsSolarPowerPredictor
+
+    solar_power_predictor = TryolabsSolarPowerPredictor()
+    solar_power_predictor.load_model()
+    return solar_power_predictor
+
+
+def _get_tryolabs_predictor():
+    """
+    Get the cached xgb predictor
+    """
+    # lock, so concurrent forecasts don't download and load the model at the same time
+    with _TRYOLABS_PREDICTOR_LOCK:
+        return _load_tryolabs_predictor()
+
+
 def predict_tryolabs(
     site: PVSite, ts: datetime | str = None):
     """
@@ -60,17 +169,10 @@ def predict_tryolabs(
     :param ts: the timestamp of the site. If None, defaults to the current timestamp rounded down to 15 minutes.
     :return: The PV forecast of the site for time (ts) for 48 hours
     """
-
-    # instantiate class to make predictions
-    solar_power_predictor = TryolabsSolarPowerPredictor()
-    
     # set start and end time, if no time is given use current time
-    if ts is None:
-        start_date = pd.Timestamp.now().strftime("%Y-%m-%d")
-        start_time = pd.Timestamp.now().round(freq='h')
-    else:
-        start_date = pd.Timestamp(ts).strftime("%Y-%m-%d")
-        start_time = pd.Timestamp(ts).round(freq='h')
+    ts = pd.Timestamp.now() if ts is None else pd.Timestamp(ts)
+    start_date = ts.strftime("%Y-%m-%d")
+    start_time = ts.round(freq='h')
 
     end_time = start_time + pd.Timedelta(hours=48)
     start_date_datetime = datetime.strptime(start_date, "%Y-%m-%d")
@@ -79,13 +181,13 @@ def predict_tryolabs(
     three_months_ago = datetime.today() - timedelta(days=3 * 30)
 
     if start_date_datetime < three_months_ago:
-        print(
-            f"Start date ({start_date}) is more than 3 months ago, no",
-            "forecast data available.",
+        log.warning(
+            f"Start date ({start_date}) is more than 3 months ago, no "
+            "forecast data available."
         )
     else:
-        # download the model from google drive and decompress if necessary
-        solar_power_predictor.load_model()
+        # the model is only downloaded and loaded once per process
+        solar_power_predictor = _get_tryolabs_predictor()
         # make predictions
         predictions = solar_power_predictor.predict_power_output(
             latitude=site.latitude,
@@ -96,16 +198,27 @@ def predict_tryolabs(
             tilt=site.tilt,
         )
 
-        # postprocessing of the dataframe
-        predictions = predictions[
-            (predictions["date"] >= start_time) & (predictions["date"] < end_time)
-        ]
-        predictions = predictions.reset_index(drop=True)
-        predictions.set_index("date", inplace=True)
-        print("Predictions finished.")
+        # postprocessing of the dataframe, slice the sorted index to [start_time, end_time)
+        predictions = predictions.set_index("date").sort_index()
+        start_idx, end_idx = predictions.index.searchsorted([start_time, end_time])
+        predictions = predictions.iloc[start_idx:end_idx]
+        log.debug("Predictions finished.")
         return predictions
 
 
+# the models available in run_forecast, each called with (site, ts, nwp_source)
+_MODELS = {
+    "gb": lambda site, ts, nwp_source: predict_ocf(site, None, ts, nwp_source),
+    "xgb": lambda site, ts, nwp_source: predict_tryolabs(site, ts),
+}
+
+# the models in run_forecast that can forecast several timestamps at once,
+# each called with (site, timestamps, nwp_source)
+_BATCH_MODELS = {
+    "gb": predict_ocf_batch,
+}
+
+
 def run_forecast(
     site: PVSite,
     model: str = "gb",
@@ -116,19 +229,79 @@ def run_forecast(
     Predict solar power output for a given site using a specified model.
 
     :param site: the PV site
-    :param model: the model to use for prediction, choose between "ocf" and "tryolabs",
-                    by default "ocf" is used
+    :param model: the model to use for prediction, choose between "gb" and "xgb",
+                    by default "gb" is used
     :param ts: the timestamp of the site. If None, defaults to the current timestamp rounded down to 15 minutes.
+               A list of timestamps can be given to forecast from each of them.
     :param nwp_source: the nwp data source. Either "gfs", "icon" or "ukmo". Defaults to "icon" 
                        (only relevant if model=="gb")
-    :return: The PV forecast of the site for time (ts) for 48 hours
+    :return: The PV forecast of the site for time (ts) for 48 hours.
+             For a list of timestamps, the forecasts are indexed by (timestamp, time),
+             leaving out timestamps the model has no forecast for.
     """
 
-    if model == "gb":
-        return predict_ocf(site, None, ts, nwp_source)
-              
-    elif model == "xgb":
-        return predict_tryolabs(site, ts)
-    
-    else:  
-        raise ValueError(f"Unsupported model: {model}. Choose between 'xgb' and 'gb'")
+    try:
+        forecast_fn = _MODELS[model]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported model: {model}. Choose between {', '.join(map(repr, sorted(_MODELS)))}"
+        ) from None
+
+    if pd.api.types.is_list_like(ts):
+        timestamps = list(ts)
+        if len(timestamps) == 0:
+            raise ValueError("At least one timestamp is needed when ts is a list")
+
+        if model in _BATCH_MODELS:
+            return _BATCH_MODELS[model](site, timestamps, nwp_source)
+
+        # models can return None when there is no forecast for a timestamp, so leave those out
+        pred_dfs = {}
+        for timestamp in timestamps:
+            pred_df = forecast_fn(site, timestamp, nwp_source)
+            if pred_df is not None:
+                pred_dfs[timestamp] = pred_df
+        if len(pred_dfs) == 0:
+            return None
+
+        return pd.concat(pred_dfs.values(), keys=list(pred_dfs))
+
+    return forecast_fn(site, ts, nwp_source)
+
+
+def run_forecasts(
+    site: PVSite,
+    model_specs: list[dict],
+    ts: datetime | str = None,
+) -> list[pd.DataFrame]:
+    """
+    Run several forecasts for the same site concurrently.
+
+    Each forecast is mostly waiting on NWP and model downloads, so they are run in threads.
+
+    :param site: the PV site
+    :param model_specs: the keyword arguments for `run_forecast` for each forecast,
+                        e.g. [{"model": "gb", "nwp_source": "gfs"}, {"model": "xgb"}]
+    :param ts: the timestamp of the site. If None, defaults to the current timestamp rounded down to 15 minutes.
+    :return: The PV forecasts, in the same order as model_specs
+    """
+    with ThreadPoolExecutor(max_workers=max(len(model_specs), 1)) as executor:
+        futures = [
+            executor.submit(run_forecast, site=site, ts=ts, **model_spec)
+            for model_spec in model_specs
+        ]
+        return [future.result() for future in futures]
+
+
+async def run_forecast_async(
+    site: PVSite,
+    model: str = "gb",
+    ts: datetime | str = None,
+    nwp_source: str = "icon",
+) -> pd.DataFrame:
+    """
+    Async version of `run_forecast`, which runs the forecast in a separate thread.
+
+    See `run_forecast` for the parameters.
+    """
+    return await asyncio.to_thread(run_forecast, site, model, ts, nwp_source)
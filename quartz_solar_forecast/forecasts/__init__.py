@@ -7,5 +7,13 @@ It is trained on 25,000 PV sites with over 5 years of PV history, which is avail
 
 """
 from .v1 import forecast_v1
-from .v1_tilt_orientation import forecast_v1_tilt_orientation
-from .v2 import TryolabsSolarPowerPredictor
+from .v1_tilt_orientation import forecast_v1_tilt_orientation, forecast_v1_tilt_orientation_batch
+
+
+def __getattr__(name):
+    # v2 depends on xgboost and huggingface_hub, so it is only imported when it is used
+    if name == "TryolabsSolarPowerPredictor":
+        from .v2 import TryolabsSolarPowerPredictor
+
+        return TryolabsSolarPowerPredictor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -15,29 +15,46 @@ def forecast_v1_tilt_orientation(nwp_source:str, nwp_xr:xr.Dataset, pv_xr:xr.Dat
 
     This runs the pv-site-prediction model, that uses tilt and orientation from the psp library.
     """
+    return forecast_v1_tilt_orientation_batch(nwp_source, [nwp_xr], [pv_xr], [ts], model=model)[0]
+
+
+def forecast_v1_tilt_orientation_batch(
+    nwp_source:str,
+    nwp_xrs:list[xr.Dataset],
+    pv_xrs:list[xr.Dataset],
+    timestamps:list[pd.Timestamp],
+    model=None,
+):
+    """
+    Run the forecast for several timestamps
+
+    The model is loaded once, and then run for each timestamp with its own nwp and pv data.
+    """
 
     if model is None:
         model = load_model(f"{dir_path}/../models/model-0.4.0.pkl")
 
-    # format pv and nwp data
-    pv_data_source = NetcdfPvDataSource(
-        pv_xr,
-        id_dim_name="pv_id",
-        timestamp_dim_name="timestamp",
-        rename={"generation_kw": "power", "kwp": "capacity"},
-        ignore_pv_ids=[],
-    )
-    # make NwpDataSource
-    nwp = NwpDataSource(nwp_xr, value_name=nwp_source)
-    model.set_data_sources(pv_data_source=pv_data_source, nwp_data_sources={nwp_source: nwp})
-
-    # make prediction.
-    # Note pv_id=1 is arbitrary, but the pv_xr must have this in it.
-    x = X(pv_id="1", ts=ts)
-    pred = model.predict(x)
-
-    # format into timerange and put into pd dataframe
-    times = pd.date_range(start=x.ts, periods=len(pred.powers), freq="15min")
-    pred_df = pd.DataFrame({"power_kw": pred.powers}, index=times)
-
-    return pred_df
+    pred_dfs = []
+    for nwp_xr, pv_xr, ts in zip(nwp_xrs, pv_xrs, timestamps):
+        # format pv and nwp data
+        pv_data_source = NetcdfPvDataSource(
+            pv_xr,
+            id_dim_name="pv_id",
+            timestamp_dim_name="timestamp",
+            rename={"generation_kw": "power", "kwp": "capacity"},
+            ignore_pv_ids=[],
+        )
+        # make NwpDataSource
+        nwp = NwpDataSource(nwp_xr, value_name=nwp_source)
+        model.set_data_sources(pv_data_source=pv_data_source, nwp_data_sources={nwp_source: nwp})
+
+        # make prediction.
+        # Note pv_id=1 is arbitrary, but the pv_xr must have this in it.
+        x = X(pv_id="1", ts=ts)
+        pred = model.predict(x)
+
+        # format into timerange and put into pd dataframe
+        times = pd.date_range(start=x.ts, periods=len(pred.powers), freq="15min")
+        pred_dfs.append(pd.DataFrame({"power_kw": pred.powers}, index=times))
+
+    return pred_dfs
@@ -1,9 +1,13 @@
-import http.client
 import os
+import time
+import logging
+import threading
+from functools import lru_cache
 from typing import Optional
 
+import orjson
 import pandas as pd
-import json
+import requests
 import base64
 from datetime import datetime, timedelta, timezone
 
@@ -13,6 +17,26 @@ from quartz_solar_forecast.inverters.inverter import AbstractInverter
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+log = logging.getLogger(__name__)
+
+ENPHASE_API_URL = "https://api.enphaseenergy.com"
+
+# Tokens are persisted here per client id, so the interactive authorization is only needed once
+ENPHASE_TOKEN_DIR = os.path.expanduser("~/.cache/quartz_solar_forecast")
+
+# Shared session so repeated calls reuse the same keep-alive HTTPS connection
+SESSION = requests.Session()
+
+# Access token cache per client id, so we only hit the token endpoint when the token is about to
+# expire. "expires_at" is a unix timestamp, so it stays valid when loaded from disk by another process.
+_TOKEN_CACHE: dict[str, dict] = {}
+
+# Lock around refreshing the tokens, so concurrent forecasts don't all use the same refresh token
+_TOKEN_LOCK = threading.Lock()
+
+# Refresh the access token this many seconds before it actually expires
+TOKEN_EXPIRY_MARGIN_S = 60
+
 
 class EnphaseSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
@@ -77,9 +101,86 @@ def get_enphase_authorization_code(auth_url):
     return code
 
 
+def _token_file(client_id: str) -> str:
+    """
+    Path of the file the Enphase tokens for a client id are persisted to.
+    """
+    return os.path.join(ENPHASE_TOKEN_DIR, f"enphase_{client_id}.json")
+
+
+def _load_refresh_token(client_id: str) -> dict:
+    """
+    Load the persisted Enphase tokens for a client id from disk, if there are any.
+    """
+    tokens = {"access_token": None, "refresh_token": None, "expires_at": 0.0}
+    try:
+        with open(_token_file(client_id), "rb") as f:
+            tokens.update(orjson.loads(f.read()))
+    except (OSError, orjson.JSONDecodeError):
+        pass
+
+    return tokens
+
+
+def _save_refresh_token(client_id: str) -> None:
+    """
+    Persist the cached Enphase tokens for a client id to disk, readable only by the current user.
+    """
+    token_file = _token_file(client_id)
+    try:
+        os.makedirs(ENPHASE_TOKEN_DIR, exist_ok=True)
+        fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "wb") as f:
+            f.write(orjson.dumps(_TOKEN_CACHE[client_id]))
+    except OSError as e:
+        log.warning(f"Could not save Enphase tokens to {token_file}: {e}")
+
+
+def _clear_refresh_token(client_id: str) -> None:
+    """
+    Remove the cached and persisted Enphase tokens for a client id, e.g. when they are revoked.
+    """
+    _TOKEN_CACHE[client_id] = {"access_token": None, "refresh_token": None, "expires_at": 0.0}
+    os.environ.pop('ENPHASE_ACCESS_TOKEN', None)
+    os.environ.pop('ENPHASE_REFRESH_TOKEN', None)
+    try:
+        os.remove(_token_file(client_id))
+    except FileNotFoundError:
+        pass
+
+
+@lru_cache
+def _encode_credentials(client_id: str, client_secret: str) -> str:
+    """
+    Base64 encode the client credentials for the Basic authorization header.
+    """
+    credentials = f"{client_id}:{client_secret}"
+    return base64.b64encode(credentials.encode("utf-8")).decode("utf-8")
+
+
+def _cached_access_token(client_id: str) -> Optional[str]:
+    """
+    Get the cached access token for a client id, if it is still valid.
+    """
+    tokens = _TOKEN_CACHE.get(client_id)
+    if (
+        tokens is not None
+        and tokens["access_token"] is not None
+        and time.time() < tokens["expires_at"] - TOKEN_EXPIRY_MARGIN_S
+    ):
+        return tokens["access_token"]
+    return None
+
+
 def get_enphase_access_token(auth_code: Optional[str] = None, settings: Optional[EnphaseSettings] = None):
     """
-    Obtain an access token for the Enphase API using the Authorization Code Grant flow.
+    Obtain an access token for the Enphase API.
+
+    A cached access token is returned if it is still valid. Otherwise the token is renewed with the
+    Refresh Token Grant flow, falling back to the Authorization Code Grant flow if no refresh token is
+    available, the refresh token is rejected, or an authorization code is given.
+    Tokens are persisted per client id in ENPHASE_TOKEN_DIR.
+
     :param auth_code: Optional authorization code. If not provided, it will be obtained.
     :param settings: Optional Enphase settings
     :return: Access Token
@@ -90,31 +191,83 @@ def get_enphase_access_token(auth_code: Optional[str] = None, settings: Optional
         settings = EnphaseSettings()
 
     client_id = settings.client_id
-    client_secret = settings.client_secret
 
     if auth_code is None:
-        auth_url = get_enphase_auth_url(settings)
-        auth_code = get_enphase_authorization_code(auth_url)
+        access_token = _cached_access_token(client_id)
+        if access_token is not None:
+            return access_token
+
+    # only one thread renews the tokens, the others wait and then use the renewed access token
+    with _TOKEN_LOCK:
+        if client_id not in _TOKEN_CACHE:
+            _TOKEN_CACHE[client_id] = _load_refresh_token(client_id)
+
+        if auth_code is None:
+            access_token = _cached_access_token(client_id)
+            if access_token is not None:
+                return access_token
+
+            # An access token set in the environment is used as is, as its expiry is unknown
+            if _TOKEN_CACHE[client_id]["access_token"] is None and os.getenv('ENPHASE_ACCESS_TOKEN'):
+                return os.getenv('ENPHASE_ACCESS_TOKEN')
+
+            refresh_token = _TOKEN_CACHE[client_id]["refresh_token"] or os.getenv('ENPHASE_REFRESH_TOKEN')
+            if refresh_token:
+                params = {
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token,
+                }
+                try:
+                    return _request_enphase_token(params, settings)
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code not in (400, 401):
+                        raise
+                    log.warning("The Enphase refresh token was rejected, re-authorization is needed")
+                    # only clear the tokens if they have not been renewed in the meantime
+                    if _TOKEN_CACHE[client_id]["refresh_token"] in (refresh_token, None):
+                        _clear_refresh_token(client_id)
+                    else:
+                        access_token = _cached_access_token(client_id)
+                        if access_token is not None:
+                            return access_token
+
+            auth_url = get_enphase_auth_url(settings)
+            auth_code = get_enphase_authorization_code(auth_url)
+
+        params = {
+            "grant_type": "authorization_code",
+            "redirect_uri": f"{ENPHASE_API_URL}/oauth/redirect_uri",
+            "code": auth_code,
+        }
+        return _request_enphase_token(params, settings)
+
+
+def _request_enphase_token(params: dict, settings: EnphaseSettings) -> str:
+    """
+    Request a new token from the Enphase token endpoint and store it in the token cache.
 
-    credentials = f"{client_id}:{client_secret}"
-    encoded_credentials = base64.b64encode(credentials.encode("utf-8")).decode("utf-8")
+    :param params: the query parameters for the token endpoint, including the grant type
+    :param settings: the Enphase settings
+    :return: Access Token
+    """
+    encoded_credentials = _encode_credentials(settings.client_id, settings.client_secret)
 
-    conn = http.client.HTTPSConnection("api.enphaseenergy.com")
     headers = {
         "Authorization": f"Basic {encoded_credentials}"
     }
-    conn.request(
-        "POST",
-        f"/oauth/token?grant_type=authorization_code&redirect_uri=https://api.enphaseenergy.com/oauth/redirect_uri&code={auth_code}",
-        "",
-        headers,
-    )
-    res = conn.getresponse()
-    data = res.read()
-    data_json = json.loads(data.decode("utf-8"))
+    res = SESSION.post(f"{ENPHASE_API_URL}/oauth/token", params=params, headers=headers)
+    res.raise_for_status()
+    data_json = orjson.loads(res.content)
     access_token = data_json["access_token"]
     refresh_token = data_json["refresh_token"]
 
+    _TOKEN_CACHE[settings.client_id] = {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "expires_at": time.time() + data_json.get("expires_in", 0),
+    }
+    _save_refresh_token(settings.client_id)
+
     # Save tokens to environment variables
     os.environ['ENPHASE_ACCESS_TOKEN'] = access_token
     os.environ['ENPHASE_REFRESH_TOKEN'] = refresh_token
@@ -160,11 +313,7 @@ def get_enphase_data(settings: EnphaseSettings) -> pd.DataFrame:
     :param enphase_system_id: System ID for Enphase API
     :return: Live PV generation in Watt-hours, assumes to be a floating-point number
     """
-    access_token = os.getenv('ENPHASE_ACCESS_TOKEN')
-
-    # If access token is not in environment variables, get a new one
-    if not access_token:
-        access_token = get_enphase_access_token(settings=settings)
+    access_token = get_enphase_access_token(settings=settings)
 
     # Set the start time to 1 week ago
     start_at = int((datetime.now() - timedelta(weeks=1)).timestamp())
@@ -172,24 +321,20 @@ def get_enphase_data(settings: EnphaseSettings) -> pd.DataFrame:
     # Set the granularity to week
     granularity = "week"
 
-    conn = http.client.HTTPSConnection("api.enphaseenergy.com")
     headers = {
         "Authorization": f"Bearer {access_token}",
         "key": settings.api_key
     }
 
     # Add the system_id and duration parameters to the URL
-    url = f"/api/v4/systems/{settings.system_id}/telemetry/production_micro?start_at={start_at}&granularity={granularity}"
-    conn.request("GET", url, headers=headers)
-
-    res = conn.getresponse()
-    data = res.read()
-
-    # Decode the data read from the response
-    decoded_data = data.decode("utf-8")
-
-    # Convert the decoded data into JSON format
-    data_json = json.loads(decoded_data)
+    url = f"{ENPHASE_API_URL}/api/v4/systems/{settings.system_id}/telemetry/production_micro"
+    params = {"start_at": start_at, "granularity": granularity}
+    res = SESSION.get(url, params=params, headers=headers)
+
+    # Parse the raw response bytes into JSON format
+    data_json = orjson.loads(res.content)
+    # only log the keys, the payload can be large and the tokens must never be logged
+    log.debug("Enphase live data keys=%s", list(data_json))
 
     # Process the data using the new function
     live_generation_kw = process_enphase_data(data_json, start_at)
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+from quartz_solar_forecast import data
+from quartz_solar_forecast.data import format_nwp_data, get_nwp_cached
+from quartz_solar_forecast.pydantic_models import PVSite
+
+
+@pytest.fixture
+def sample_site():
+    return PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=1.25)
+
+
+@pytest.fixture
+def nwp_calls(monkeypatch, tmp_path, sample_site):
+    monkeypatch.setattr(data, "NWP_CACHE_DIR", str(tmp_path))
+
+    calls = []
+
+    def mock_get_nwp(site, ts, nwp_source="icon", forecast_days=7):
+        calls.append(ts)
+        df = pd.DataFrame(
+            {"t": [10.0, 11.0, 12.0], "dswrf": [0.0, 100.0, 200.0]},
+            index=pd.date_range(ts.date(), periods=3, freq="h"),
+        )
+        return format_nwp_data(df, nwp_source, site)
+
+    monkeypatch.setattr(data, "get_nwp", mock_get_nwp)
+    return calls
+
+
+def test_get_nwp_cached_historical(sample_site, nwp_calls):
+    ts = datetime(2024, 1, 1, 12)
+
+    nwp_xr = get_nwp_cached(sample_site, ts, "icon")
+    nwp_xr_cached = get_nwp_cached(sample_site, ts, "icon")
+
+    assert len(nwp_calls) == 1
+    xr.testing.assert_identical(nwp_xr, nwp_xr_cached)
+
+    # a different time on the same date uses the same cache entry
+    get_nwp_cached(sample_site, ts + timedelta(hours=3), "icon")
+    assert len(nwp_calls) == 1
+
+    # a different nwp source is a different cache entry
+    get_nwp_cached(sample_site, ts, "gfs")
+    assert len(nwp_calls) == 2
+
+
+def test_get_nwp_cached_recent_expires(sample_site, nwp_calls, tmp_path):
+    ts = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    get_nwp_cached(sample_site, ts, "icon")
+    get_nwp_cached(sample_site, ts, "icon")
+    assert len(nwp_calls) == 1
+
+    # make the cache entry older than the expiry time
+    old = (datetime.now() - timedelta(days=2)).timestamp()
+    for filename in os.listdir(tmp_path):
+        os.utime(tmp_path / filename, (old, old))
+
+    get_nwp_cached(sample_site, ts, "icon")
+    assert len(nwp_calls) == 2
+
+    # the expired entry was replaced, not kept alongside the new one
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_get_nwp_cached_long_window_expires(sample_site, nwp_calls, tmp_path):
+    # an old ts, but with forecast_days reaching into the last week, as in a batch forecast
+    ts = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=30)
+
+    get_nwp_cached(sample_site, ts, "icon", forecast_days=37)
+    get_nwp_cached(sample_site, ts, "icon", forecast_days=37)
+    assert len(nwp_calls) == 1
+
+    # make the cache entry older than the expiry time
+    old = (datetime.now() - timedelta(days=2)).timestamp()
+    for filename in os.listdir(tmp_path):
+        os.utime(tmp_path / filename, (old, old))
+
+    get_nwp_cached(sample_site, ts, "icon", forecast_days=37)
+    assert len(nwp_calls) == 2
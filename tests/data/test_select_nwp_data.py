@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from datetime import datetime
+
+from quartz_solar_forecast.data import format_nwp_data, select_nwp_data
+from quartz_solar_forecast.pydantic_models import PVSite
+
+
+def test_select_nwp_data():
+    site = PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=1.25)
+
+    # hourly nwp data for 12 days, as get_nwp returns it for forecast_days=11
+    index = pd.date_range("2024-06-01", "2024-06-12 23:00", freq="h")
+    df = pd.DataFrame({"t": np.arange(len(index), dtype=np.float64)}, index=index)
+    nwp_xr = format_nwp_data(df, "icon", site)
+
+    ts = datetime(2024, 6, 3, 14, 15)
+    selected_xr = select_nwp_data(nwp_xr, ts)
+
+    # the same as get_nwp for ts, which covers the date of ts and the 7 days after it
+    expected_xr = format_nwp_data(df.loc["2024-06-03":"2024-06-10"], "icon", site)
+    xr.testing.assert_identical(selected_xr, expected_xr)
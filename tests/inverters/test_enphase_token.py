@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import pytest
+import requests
+
+from quartz_solar_forecast.inverters import enphase
+from quartz_solar_forecast.inverters.enphase import EnphaseSettings, get_enphase_access_token
+
+
+class MockResponse:
+    def __init__(self, data_json, status_code=200):
+        self.content = orjson.dumps(data_json)
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            response = requests.Response()
+            response.status_code = self.status_code
+            raise requests.HTTPError(response=response)
+
+
+@pytest.fixture
+def settings():
+    return EnphaseSettings(
+        ENPHASE_CLIENT_ID="client_id",
+        ENPHASE_SYSTEM_ID="system_id",
+        ENPHASE_API_KEY="api_key",
+        ENPHASE_CLIENT_SECRET="client_secret",
+    )
+
+
+@pytest.fixture
+def token_requests(monkeypatch, tmp_path):
+    monkeypatch.setattr(enphase, "ENPHASE_TOKEN_DIR", str(tmp_path))
+    monkeypatch.setattr(enphase, "_TOKEN_CACHE", {})
+    monkeypatch.delenv("ENPHASE_REFRESH_TOKEN", raising=False)
+    monkeypatch.delenv("ENPHASE_ACCESS_TOKEN", raising=False)
+
+    calls = []
+
+    def mock_post(url, params=None, headers=None):
+        calls.append(params)
+        # refresh tokens are rotated, so a refresh token can only be used once
+        used_refresh_tokens = [call["refresh_token"] for call in calls[:-1] if "refresh_token" in call]
+        if params.get("refresh_token") in ["revoked"] + used_refresh_tokens:
+            return MockResponse({"error": "invalid_grant"}, status_code=401)
+        time.sleep(0.05)
+        return MockResponse(
+            {
+                "access_token": f"access_{len(calls)}",
+                "refresh_token": f"refresh_{len(calls)}",
+                "expires_in": 86400,
+            }
+        )
+
+    monkeypatch.setattr(enphase.SESSION, "post", mock_post)
+    return calls
+
+
+def test_access_token_is_cached(settings, token_requests):
+    first = get_enphase_access_token(auth_code="code", settings=settings)
+    second = get_enphase_access_token(settings=settings)
+
+    assert first == second == "access_1"
+    assert len(token_requests) == 1
+    assert token_requests[0]["grant_type"] == "authorization_code"
+
+
+def test_expired_access_token_uses_refresh_token(settings, token_requests):
+    get_enphase_access_token(auth_code="code", settings=settings)
+    enphase._TOKEN_CACHE["client_id"]["expires_at"] = 0.0
+
+    access_token = get_enphase_access_token(settings=settings)
+
+    assert access_token == "access_2"
+    assert token_requests[1] == {"grant_type": "refresh_token", "refresh_token": "refresh_1"}
+
+
+def test_tokens_are_persisted(settings, token_requests, tmp_path):
+    get_enphase_access_token(auth_code="code", settings=settings)
+    assert os.path.isfile(tmp_path / "enphase_client_id.json")
+
+    # simulate a new process, which only has the tokens on disk
+    enphase._TOKEN_CACHE.clear()
+    access_token = get_enphase_access_token(settings=settings)
+
+    assert access_token == "access_1"
+    assert len(token_requests) == 1
+
+
+def test_tokens_are_kept_per_client_id(settings, token_requests):
+    get_enphase_access_token(auth_code="code", settings=settings)
+
+    other_settings = settings.model_copy(update={"client_id": "other_client_id"})
+    access_token = get_enphase_access_token(auth_code="other_code", settings=other_settings)
+
+    assert access_token == "access_2"
+    assert get_enphase_access_token(settings=settings) == "access_1"
+    assert get_enphase_access_token(settings=other_settings) == "access_2"
+
+
+def test_rejected_refresh_token_is_cleared(settings, token_requests, tmp_path, monkeypatch):
+    get_enphase_access_token(auth_code="code", settings=settings)
+    enphase._TOKEN_CACHE["client_id"].update({"refresh_token": "revoked", "expires_at": 0.0})
+    monkeypatch.setattr(enphase, "get_enphase_authorization_code", lambda auth_url: "new_code")
+
+    access_token = get_enphase_access_token(settings=settings)
+
+    # the refresh grant failed, so the authorization code flow was used instead
+    assert access_token == "access_3"
+    assert token_requests[1]["grant_type"] == "refresh_token"
+    assert token_requests[2]["grant_type"] == "authorization_code"
+    assert enphase._TOKEN_CACHE["client_id"]["refresh_token"] == "refresh_3"
+
+
+def test_access_token_from_environment(settings, token_requests, monkeypatch):
+    monkeypatch.setenv("ENPHASE_ACCESS_TOKEN", "access_env")
+
+    assert get_enphase_access_token(settings=settings) == "access_env"
+    assert len(token_requests) == 0
+
+
+def test_concurrent_refresh_uses_refresh_token_once(settings, token_requests):
+    get_enphase_access_token(auth_code="code", settings=settings)
+    enphase._TOKEN_CACHE["client_id"]["expires_at"] = 0.0
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        access_tokens = list(
+            executor.map(lambda _: get_enphase_access_token(settings=settings), range(4))
+        )
+
+    # one thread refreshed the token, the others waited and used the new token
+    assert access_tokens == ["access_2"] * 4
+    assert len(token_requests) == 2
+    assert enphase._TOKEN_CACHE["client_id"]["refresh_token"] == "refresh_2"
@@ -1,8 +1,16 @@
-from quartz_solar_forecast.forecast import run_forecast
+from quartz_solar_forecast.forecast import run_forecast, run_forecasts
 from quartz_solar_forecast.pydantic_models import PVSite
 from datetime import datetime, timedelta
 
 import numpy as np
+import pytest
+
+MODEL_SPECS = [
+    {"model": "gb", "nwp_source": "gfs"},
+    {"model": "gb", "nwp_source": "icon"},
+    {"model": "gb", "nwp_source": "ukmo"},
+    {"model": "xgb"},
+]
 
 
 def test_run_forecast():
@@ -10,11 +18,13 @@ def test_run_forecast():
     site = PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=1.25)
     ts = datetime.today() - timedelta(weeks=2)
 
-    # run model with icon, gfs and ukmo nwp
-    predications_df_gfs = run_forecast(site=site, model="gb", ts=ts, nwp_source="gfs")
-    predications_df_icon = run_forecast(site=site, model="gb", ts=ts, nwp_source="icon")
-    predications_df_ukmo = run_forecast(site=site, model="gb", ts=ts, nwp_source="ukmo")
-    predications_df_xgb = run_forecast(site=site, ts=ts)
+    # run model with icon, gfs and ukmo nwp, and the default model
+    (
+        predications_df_gfs,
+        predications_df_icon,
+        predications_df_ukmo,
+        predications_df_xgb,
+    ) = run_forecasts(site=site, ts=ts, model_specs=MODEL_SPECS[:3] + [{}])
 
     print("\n Prediction based on GFS NWP\n")
     print(predications_df_gfs)
@@ -40,10 +50,12 @@ def test_run_forecast_historical():
     ts = datetime.today() - timedelta(days=200)
 
     # run model with icon, gfs and ukmo nwp
-    predications_df_gfs = run_forecast(site=site, ts=ts, model="gb", nwp_source="gfs")
-    predications_df_icon = run_forecast(site=site, ts=ts, model="gb", nwp_source="icon")
-    predications_df_ukmo = run_forecast(site=site, ts=ts, model="gb", nwp_source="ukmo")
-    predications_df_xgb = run_forecast(site=site, ts=ts, model="xgb")
+    (
+        predications_df_gfs,
+        predications_df_icon,
+        predications_df_ukmo,
+        predications_df_xgb,
+    ) = run_forecasts(site=site, ts=ts, model_specs=MODEL_SPECS)
 
     print("\nPrediction for a date more than 180 days in the past")
 
@@ -77,3 +89,48 @@ def test_large_capacity():
     assert np.round(predications_df["power_kw"].sum() * 1000, 8) == np.round(
         predications_df_large["power_kw"].sum(), 8
     )
+
+
+def test_run_forecasts_large_capacity():
+
+    # the same site object is used by concurrent forecasts, so it must not be modified
+    site_large = PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=4000)
+    ts = datetime.today() - timedelta(weeks=2)
+
+    predications_df_gfs, predications_df_icon = run_forecasts(
+        site=site_large,
+        ts=ts,
+        model_specs=[{"model": "gb", "nwp_source": "gfs"}, {"model": "gb", "nwp_source": "icon"}],
+    )
+
+    assert site_large.capacity_kwp == 4000
+    assert predications_df_gfs["power_kw"].max() > 4
+    assert predications_df_icon["power_kw"].max() > 4
+
+
+def test_run_forecast_batch():
+
+    # make input data, including a timestamp more than 3 months ago, which uses historical nwp data
+    site = PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=1.25)
+    ts = datetime.today().replace(minute=0, second=0, microsecond=0) - timedelta(weeks=2)
+    timestamps = [ts - timedelta(days=100), ts, ts + timedelta(hours=6), ts + timedelta(days=1)]
+
+    # run the gb model for all timestamps with one nwp fetch per nwp api
+    predications_df = run_forecast(site=site, model="gb", ts=timestamps, nwp_source="icon")
+
+    assert list(predications_df.index.get_level_values(0).unique()) == timestamps
+    for timestamp in timestamps:
+        predications_df_single = run_forecast(site=site, model="gb", ts=timestamp, nwp_source="icon")
+
+        assert predications_df.loc[timestamp].index.equals(predications_df_single.index)
+        assert np.allclose(
+            predications_df.loc[timestamp]["power_kw"].values,
+            predications_df_single["power_kw"].values,
+        )
+
+
+def test_run_forecast_batch_empty():
+    site = PVSite(latitude=51.75, longitude=-1.25, capacity_kwp=1.25)
+
+    with pytest.raises(ValueError):
+        run_forecast(site=site, model="gb", ts=[])